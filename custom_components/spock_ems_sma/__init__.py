@@ -78,9 +78,10 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Registrar las plataformas (sensor.py, switch.py)
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
-    # Asegurar cierre de sesión de pysma en apagado de HA
+    # Asegurar cierre de sesión de pysma y de la conexión Modbus en apagado de HA
     async def _async_handle_shutdown(event: Event) -> None:
         await pysma_api.close_session()
+        coordinator.battery_writer.close()
 
     entry.async_on_unload(
         hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_handle_shutdown)
@@ -95,8 +96,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     coordinator: SmaTelemetryCoordinator = hass.data[DOMAIN][entry.entry_id][
         "coordinator"
     ]
-    # Cerramos la sesión de pysma
+    # Cerramos la sesión de pysma y la conexión Modbus
     await coordinator.pysma_api.close_session()
+    coordinator.battery_writer.close()
 
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
 
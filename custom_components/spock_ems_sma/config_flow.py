@@ -160,29 +160,9 @@ class SmaSpockOptionsFlow(config_entries.OptionsFlow):
                 )
                 errors["base"] = "unknown"
 
-        options_schema = vol.Schema(
-            {
-                vol.Required(
-                    CONF_PLANT_ID, default=data.get(CONF_PLANT_ID)
-                ): str,
-                vol.Required(
-                    CONF_SPOCK_API_TOKEN, default=data.get(CONF_SPOCK_API_TOKEN)
-                ): str,
-                vol.Required(CONF_HOST, default=data.get(CONF_HOST)): str,
-                vol.Optional(
-                    CONF_GROUP,
-                    default=data.get(CONF_GROUP, DEFAULT_GROUP),
-                ): vol.In(GROUPS),
-                vol.Required(
-                    CONF_PASSWORD, default=data.get(CONF_PASSWORD)
-                ): str,
-                vol.Optional(CONF_SSL, default=data.get(CONF_SSL, True)): bool,
-                vol.Optional(
-                    CONF_MODBUS_UNIT_ID,
-                    default=data.get(CONF_MODBUS_UNIT_ID, 3),
-                ): int,
-            }
-        )
+        # Usamos las mismas definiciones de campos que DATA_SCHEMA (sin mantener
+        # una segunda copia) y prellenamos con los valores actuales como sugeridos.
+        options_schema = self.add_suggested_values_to_schema(DATA_SCHEMA, data)
 
         return self.async_show_form(
             step_id="init",
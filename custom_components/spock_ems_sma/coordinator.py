@@ -1,13 +1,14 @@
+import asyncio
 import logging
-import async_timeout
-import json
-from aiohttp import ClientSession, ClientError
+from aiohttp import ClientError, ClientSession, ClientTimeout
 from typing import Optional, Dict, Any
 
+from homeassistant.helpers.json import json_bytes
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
     UpdateFailed,
 )
+from homeassistant.util.json import json_loads
 
 from pysma import (
     SMAWebConnect,
@@ -22,6 +23,34 @@ from .sma_writer import SMABatteryWriter
 
 _LOGGER = logging.getLogger(__name__)
 
+# Tope de la petición a Spock (incluye lectura del cuerpo de la respuesta)
+_SPOCK_API_TIMEOUT = ClientTimeout(total=10, connect=3)
+
+# operation_mode de Spock → método del escritor que aplica la consigna (W)
+_POWER_MODE_HANDLERS = {
+    "charge": SMABatteryWriter.set_charge_watts,
+    "discharge": SMABatteryWriter.set_discharge_watts,
+}
+
+
+# Sensores pysma que se suman para obtener cada magnitud agregada
+_PV_POWER_KEYS = ("pv_power_a", "pv_power_b")
+_GRID_DRAW_KEYS = (
+    "metering_active_power_draw_l1",
+    "metering_active_power_draw_l2",
+    "metering_active_power_draw_l3",
+)
+_GRID_FEED_KEYS = (
+    "metering_active_power_feed_l1",
+    "metering_active_power_feed_l2",
+    "metering_active_power_feed_l3",
+)
+
+
+def _sum_sensors(sensors_dict: dict, keys: tuple) -> float:
+    """Suma los valores de 'keys' (los ausentes o None cuentan como 0)."""
+    return sum(sensors_dict.get(key) or 0 for key in keys)
+
 
 def to_int_str_or_none(val: Any) -> Optional[str]:
     """Convierte un valor a int-string, o devuelve None (objeto)."""
@@ -58,17 +87,26 @@ class SmaTelemetryCoordinator(DataUpdateCoordinator):
         self.pysma_api = pysma_api
         self._http_session = http_session
         self._spock_api_url = spock_api_url
-        self._plant_id = plant_id
+
+        # Campos fijos del payload a Spock (no cambian durante la vida de la entry)
+        self._payload_base = {
+            "plant_id": str(plant_id),
+            "bat_charge_allowed": "true",
+            "bat_discharge_allowed": "true",
+            "bat_capacity": "0",
+        }
 
         self._headers = {
             "X-Auth-Token": api_token,
             "Content-Type": "application/json",
         }
 
-        # Configuración Modbus para control de batería
-        self._modbus_host = modbus_host
-        self._modbus_port = modbus_port
-        self._modbus_unit_id = modbus_unit_id
+        # Escritor Modbus para control de batería (conexión persistente)
+        self.battery_writer = SMABatteryWriter(
+            host=modbus_host,
+            port=modbus_port,
+            unit_id=modbus_unit_id,
+        )
 
         self.sensors = None
         self.polling_enabled = True
@@ -80,6 +118,9 @@ class SmaTelemetryCoordinator(DataUpdateCoordinator):
             _LOGGER,
             name=f"{DOMAIN} Telemetry",
             update_interval=SCAN_INTERVAL_SMA,
+            # Los datos son un dict comparable: si no cambian entre ciclos,
+            # no se notifica a las entidades.
+            always_update=False,
         )
 
     async def async_initialize_sensors(self):
@@ -162,24 +203,16 @@ class SmaTelemetryCoordinator(DataUpdateCoordinator):
         battery_power = charge - discharge
 
         # 2. PV Power (Suma de strings A y B)
-        pv_a = sensors_dict.get("pv_power_a", 0) or 0
-        pv_b = sensors_dict.get("pv_power_b", 0) or 0
-        pv_power = pv_a + pv_b
+        pv_power = _sum_sensors(sensors_dict, _PV_POWER_KEYS)
 
         # 3. Grid Import (suma de potencia consumida por fase)
         #    Los sensores totales (metering_power_absorbed/supplied) dan el
         #    neto trifásico, que se cancela entre fases. Sumamos por fase
         #    para obtener el valor real.
-        draw_l1 = sensors_dict.get("metering_active_power_draw_l1", 0) or 0
-        draw_l2 = sensors_dict.get("metering_active_power_draw_l2", 0) or 0
-        draw_l3 = sensors_dict.get("metering_active_power_draw_l3", 0) or 0
-        grid_import = draw_l1 + draw_l2 + draw_l3
+        grid_import = _sum_sensors(sensors_dict, _GRID_DRAW_KEYS)
 
         # 4. Grid Export (suma de potencia inyectada por fase)
-        feed_l1 = sensors_dict.get("metering_active_power_feed_l1", 0) or 0
-        feed_l2 = sensors_dict.get("metering_active_power_feed_l2", 0) or 0
-        feed_l3 = sensors_dict.get("metering_active_power_feed_l3", 0) or 0
-        grid_export = feed_l1 + feed_l2 + feed_l3
+        grid_export = _sum_sensors(sensors_dict, _GRID_FEED_KEYS)
 
         # 5. Red (totales del contador) para el payload a Spock
         #    ongrid_power = absorbido - inyectado (positivo = importa, negativo = exporta)
@@ -195,16 +228,13 @@ class SmaTelemetryCoordinator(DataUpdateCoordinator):
         load_power = pv_power + grid_import - grid_export - battery_power
 
         spock_payload = {
-            "plant_id": str(self._plant_id),
+            **self._payload_base,
             "bat_soc": to_int_str_or_none(sensors_dict.get("battery_soc_total")),
             "bat_power": to_int_str_or_none(battery_power),
             "pv_power": to_int_str_or_none(pv_power),
             "load_power": to_int_str_or_none(load_power),
             "ongrid_power": to_int_str_or_none(ongrid_power),
             "total_grid_output_energy": to_int_str_or_none(grid_output),
-            "bat_charge_allowed": "true",
-            "bat_discharge_allowed": "true",
-            "bat_capacity": "0",
         }
 
         return spock_payload
@@ -222,33 +252,39 @@ class SmaTelemetryCoordinator(DataUpdateCoordinator):
             spock_payload,
         )
 
-        serialized_payload = json.dumps(spock_payload)
+        # Serialización con orjson (vía helper de HA) directamente a bytes
+        serialized_payload = json_bytes(spock_payload)
 
         try:
-            async with async_timeout.timeout(10):
-                response = await self._http_session.post(
-                    self._spock_api_url,
-                    data=serialized_payload,
-                    headers=self._headers,
-                )
+            async with self._http_session.post(
+                self._spock_api_url,
+                data=serialized_payload,
+                headers=self._headers,
+                timeout=_SPOCK_API_TIMEOUT,
+            ) as response:
+                # Leemos el cuerpo una sola vez como bytes (sin detección de charset)
+                raw = await response.read()
 
             if response.status != 200:
-                txt = await response.text()
                 _LOGGER.error(
                     "Error HTTP al llamar a Spock (%s): %s",
                     response.status,
-                    txt,
+                    raw[:256].decode("utf-8", "replace"),
                 )
                 raise UpdateFailed(
                     f"Error de API Spock (HTTP {response.status})"
                 )
 
             try:
-                data = await response.json(content_type=None)
+                # Cuerpo vacío → None, como hacía response.json(content_type=None)
+                data = json_loads(raw) if raw.strip() else None
             except Exception as e:
                 _LOGGER.error("No se pudo parsear JSON de respuesta Spock: %s", e)
                 raise
 
+        except asyncio.TimeoutError:
+            _LOGGER.warning("Timeout en PUSH a Spock")
+            raise
         except ClientError as e:
             _LOGGER.warning("Error de red en PUSH a Spock: %s", e)
             raise
@@ -296,75 +332,34 @@ class SmaTelemetryCoordinator(DataUpdateCoordinator):
         if mag < 0:
             mag = -mag
 
-        writer = SMABatteryWriter(
-            host=self._modbus_host,
-            port=self._modbus_port,
-            unit_id=self._modbus_unit_id,
-        )
-
         # Modo AUTO → devolver control interno
         if op_mode == "auto":
             _LOGGER.debug(
                 "Spock: operation_mode=auto. Poniendo batería SMA en modo AUTO."
             )
-            await self.hass.async_add_executor_job(writer.set_auto_mode)
+            await self.battery_writer.set_auto_mode()
             return
 
-        # Modo CHARGE → consigna de carga
-        if op_mode == "charge":
-            if mag < 0:
-                _LOGGER.warning(
-                    "Spock: operation_mode=charge pero 'action' no válido (%s). "
-                    "Pasando a AUTO.",
-                    raw_action,
-                )
-                await self.hass.async_add_executor_job(writer.set_auto_mode)
-                return
-
+        # Modos CHARGE / DISCHARGE → consigna de potencia
+        handler = _POWER_MODE_HANDLERS.get(op_mode)
+        if handler is not None:
             _LOGGER.debug(
-                "Spock: operation_mode=charge, action=%s W. Forzando CARGA.", mag
-            )
-            await self.hass.async_add_executor_job(
-                writer.set_charge_watts, mag
+                "Spock: operation_mode=%s, action=%s W. Forzando consigna.",
+                op_mode,
+                mag,
             )
-            return
-
-        # Modo DISCHARGE → consigna de descarga
-        if op_mode == "discharge":
-            if mag < 0:
-                _LOGGER.warning(
-                    "Spock: operation_mode=discharge pero 'action' no válido (%s). "
-                    "Pasando a AUTO.",
-                    raw_action,
-                )
-            else:
-                _LOGGER.debug(
-                    "Spock: operation_mode=discharge, action=%s W. Forzando DESCARGA.",
-                    mag,
-                )
-                await self.hass.async_add_executor_job(
-                    writer.set_discharge_watts, mag
-                )
-                return
-
-            # Si llegamos aquí, 'action' no era válido
-            await self.hass.async_add_executor_job(writer.set_auto_mode)
+            await handler(self.battery_writer, mag)
             return
 
         # Cualquier otro modo desconocido → AUTO por seguridad
         _LOGGER.warning(
             "Spock: operation_mode '%s' no soportado. Pasando a AUTO.", op_mode
         )
-        await self.hass.async_add_executor_job(writer.set_auto_mode)
+        await self.battery_writer.set_auto_mode()
 
     async def _fallback_auto_mode(self) -> None:
         """Pone la batería en modo AUTO como fallback si falla la petición a Spock."""
         _LOGGER.warning(
             "Fallo en la petición a Spock. Poniendo batería SMA en modo AUTO por seguridad."
         )
-        writer = SMABatteryWriter(
-            host=self._modbus_host,
-            port=self._modbus_port,
-            unit_id=self._modbus_unit_id,
-        )
-        await self.hass.async_add_executor_job(writer.set_auto_mode)
+        await self.battery_writer.set_auto_mode()
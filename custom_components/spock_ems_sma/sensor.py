@@ -136,7 +136,9 @@ async def async_setup_entry(hass, entry, async_add_entities):
                     )
                 )
             else:
-                _LOGGER.debug(f"Sensor '{pysma_key}' no encontrado en datos de SMA, se omitirá.")
+                _LOGGER.debug(
+                    "Sensor '%s' no encontrado en datos de SMA, se omitirá.", pysma_key
+                )
     
     async_add_entities(sensors)
 
@@ -1,7 +1,10 @@
+import asyncio
+import inspect
 import logging
+import struct
 from typing import Optional
 
-from pymodbus.client import ModbusTcpClient
+from pymodbus.client import AsyncModbusTcpClient
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -12,113 +15,141 @@ REGISTER_CONTROL_MODE = 40151    # 802 = manual/external, 803 = auto/internal
 MANUAL_MODE_VALUE = 802
 AUTO_MODE_VALUE = 803
 
+# Timeouts (s): por petición Modbus (LAN) y tope total por orden, para que un
+# inversor caído no bloquee el ciclo del coordinador con los reintentos.
+MODBUS_REQUEST_TIMEOUT = 1
+MODBUS_COMMAND_TIMEOUT = 5
+
+# Bloque 40149..40152: consigna s32 + modo u32 (big-endian) -> 4 registros u16
+_SETPOINT_MODE_STRUCT = struct.Struct(">iI")
+_BLOCK_REGS_STRUCT = struct.Struct(">4H")
+
+
+def _encode_block(setpoint: int, mode: int) -> tuple[int, ...]:
+    """Codifica consigna + modo como los 4 registros del bloque 40149..40152."""
+    return _BLOCK_REGS_STRUCT.unpack(_SETPOINT_MODE_STRUCT.pack(setpoint, mode))
+
+
+# Bloque constante del modo AUTO (0 W + control interno), calculado una vez
+_AUTO_MODE_REGS = _encode_block(0, AUTO_MODE_VALUE)
+
+
+def _detect_unit_kwarg() -> str:
+    """
+    Nombre del argumento de unit_id en pymodbus: 'device_id' (>= 3.10)
+    o 'slave' (3.x anteriores). Se resuelve una sola vez al importar.
+    """
+    params = inspect.signature(AsyncModbusTcpClient.write_registers).parameters
+    return "device_id" if "device_id" in params else "slave"
+
+
+_UNIT_KWARG = _detect_unit_kwarg()
+
 
 class SMABatteryWriter:
     """
     Encapsula las escrituras Modbus necesarias para controlar
     la batería del inversor SMA (STPxx-3SE-40, etc.).
+
+    La conexión TCP se mantiene abierta entre órdenes y sólo se
+    re-establece si se pierde o si una escritura falla.
     """
 
     def __init__(self, host: str, port: int = 502, unit_id: int = 3) -> None:
         self._host = host
         self._port = port
         self._unit_id = unit_id
+        self._unit_kwargs = {_UNIT_KWARG: unit_id}
+        self._client: Optional[AsyncModbusTcpClient] = None
+        # Serializa el acceso al cliente compartido (una transacción a la vez)
+        self._lock = asyncio.Lock()
 
     # ------------------------
     # Helpers internos
     # ------------------------
 
-    @staticmethod
-    def _split_u32(val: int) -> tuple[int, int]:
-        val &= 0xFFFFFFFF
-        hi = (val >> 16) & 0xFFFF
-        lo = val & 0xFFFF
-        return hi, lo
-
-    @classmethod
-    def _split_s32(cls, val: int) -> tuple[int, int]:
+    async def _write_block(
+        self, client: AsyncModbusTcpClient, regs: tuple[int, ...]
+    ) -> None:
         """
-        Convierte un entero con signo a representación unsigned 32
-        y lo separa en dos registros de 16 bits.
+        Escribe consigna (40149, s32) y modo (40151, u32) en una sola
+        transacción FC16: los cuatro registros son contiguos.
         """
-        if val < 0:
-            val = (val + (1 << 32)) & 0xFFFFFFFF
-        return cls._split_u32(val)
-
-    def _write_u32(self, client: ModbusTcpClient, address: int, value: int) -> None:
-        hi, lo = self._split_u32(value)
-        regs = [hi, lo]
-        res = client.write_registers(address, regs, device_id=self._unit_id)
-        if res is None or res.isError():
-            _LOGGER.error(
-                "Error en write_u32 adr=%s value=%s res=%s",
-                address,
-                value,
-                res,
-            )
-        else:
-            _LOGGER.debug(
-                "write_u32 OK adr=%s value=%s regs=%s", address, value, regs
-            )
-
-    def _write_s32(self, client: ModbusTcpClient, address: int, value: int) -> None:
-        hi, lo = self._split_s32(value)
-        regs = [hi, lo]
-        res = client.write_registers(address, regs, device_id=self._unit_id)
+        res = await client.write_registers(
+            REGISTER_POWER_SETPOINT, list(regs), **self._unit_kwargs
+        )
         if res is None or res.isError():
             _LOGGER.error(
-                "Error en write_s32 adr=%s value=%s res=%s",
-                address,
-                value,
+                "Error en escritura adr=%s regs=%s res=%s",
+                REGISTER_POWER_SETPOINT,
+                regs,
                 res,
             )
         else:
             _LOGGER.debug(
-                "write_s32 OK adr=%s value=%s regs=%s", address, value, regs
+                "Escritura OK adr=%s regs=%s", REGISTER_POWER_SETPOINT, regs
             )
 
-    def _open_client(self) -> Optional[ModbusTcpClient]:
-        client = ModbusTcpClient(self._host, port=self._port)
-        if not client.connect():
+    async def _get_client(self) -> Optional[AsyncModbusTcpClient]:
+        """Devuelve el cliente persistente, conectándolo sólo si hace falta."""
+        if self._client is not None:
+            if self._client.connected:
+                return self._client
+            # Conexión perdida: descartamos el cliente (close() cancela también
+            # la reconexión interna de pymodbus) y abrimos uno nuevo.
+            self.close()
+
+        self._client = AsyncModbusTcpClient(
+            self._host, port=self._port, timeout=MODBUS_REQUEST_TIMEOUT
+        )
+        if not await self._client.connect():
             _LOGGER.error(
                 "No se pudo conectar al inversor SMA por Modbus en %s:%s (unit_id=%s)",
                 self._host,
                 self._port,
                 self._unit_id,
             )
-            client.close()
+            self.close()
             return None
-        return client
+        return self._client
+
+    async def _async_send(self, regs: tuple[int, ...], action: str) -> None:
+        """Conecta (si hace falta) y escribe el bloque consigna/modo."""
+        async with self._lock:
+            try:
+                async with asyncio.timeout(MODBUS_COMMAND_TIMEOUT):
+                    client = await self._get_client()
+                    if client is None:
+                        return
+                    await self._write_block(client, regs)
+            except Exception as e:
+                _LOGGER.error("Error al %s en batería SMA: %s", action, e)
+                self.close()
 
     # ------------------------
     # API pública
     # ------------------------
 
-    def set_auto_mode(self) -> None:
+    def close(self) -> None:
+        """Cierra la conexión Modbus (se reabrirá en la siguiente orden)."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def set_auto_mode(self) -> None:
         """
         Pone la batería en modo AUTO / control interno:
           - 40149 = 0 W (sin consigna externa)
           - 40151 = 803 (control interno)
         """
-        client = self._open_client()
-        if client is None:
-            return
-
-        try:
-            _LOGGER.info(
-                "Poniendo batería SMA en modo AUTO (40149=0, 40151=%s)",
-                AUTO_MODE_VALUE,
-            )
-            # 1) Quitar consigna externa
-            self._write_s32(client, REGISTER_POWER_SETPOINT, 0)
-            # 2) Volver a control interno
-            self._write_u32(client, REGISTER_CONTROL_MODE, AUTO_MODE_VALUE)
-        except Exception as e:
-            _LOGGER.error("Error al poner modo AUTO en batería SMA: %s", e)
-        finally:
-            client.close()
-
-    def set_charge_watts(self, watts: int) -> None:
+        _LOGGER.info(
+            "Poniendo batería SMA en modo AUTO (40149=0, 40151=%s)",
+            AUTO_MODE_VALUE,
+        )
+        # Quitar consigna externa y volver a control interno
+        await self._async_send(_AUTO_MODE_REGS, "poner modo AUTO")
+
+    async def set_charge_watts(self, watts: int) -> None:
         """
         Fuerza la carga de la batería con 'watts' W.
         Según tus scripts:
@@ -132,30 +163,21 @@ class SMABatteryWriter:
             )
             return
 
-        client = self._open_client()
-        if client is None:
-            return
-
         setpoint = -int(abs(watts))  # negativo = carga
 
-        try:
-            _LOGGER.info(
-                "Configurando batería SMA en modo MANUAL carga %s W "
-                "(40151=%s, 40149=%s)",
-                watts,
-                MANUAL_MODE_VALUE,
-                setpoint,
-            )
-            # 1) Habilitar control manual / externo
-            self._write_u32(client, REGISTER_CONTROL_MODE, MANUAL_MODE_VALUE)
-            # 2) Escribir consigna de potencia (negativa = carga)
-            self._write_s32(client, REGISTER_POWER_SETPOINT, setpoint)
-        except Exception as e:
-            _LOGGER.error("Error al forzar carga en batería SMA: %s", e)
-        finally:
-            client.close()
-
-    def set_discharge_watts(self, watts: int) -> None:
+        _LOGGER.info(
+            "Configurando batería SMA en modo MANUAL carga %s W "
+            "(40151=%s, 40149=%s)",
+            watts,
+            MANUAL_MODE_VALUE,
+            setpoint,
+        )
+        # Consigna de potencia (negativa = carga) + control manual / externo
+        await self._async_send(
+            _encode_block(setpoint, MANUAL_MODE_VALUE), "forzar carga"
+        )
+
+    async def set_discharge_watts(self, watts: int) -> None:
         """
         Fuerza la descarga de la batería con 'watts' W.
         Según tus scripts:
@@ -169,25 +191,16 @@ class SMABatteryWriter:
             )
             return
 
-        client = self._open_client()
-        if client is None:
-            return
-
         setpoint = int(abs(watts))  # positivo = descarga
 
-        try:
-            _LOGGER.info(
-                "Configurando batería SMA en modo MANUAL descarga %s W "
-                "(40151=%s, 40149=%s)",
-                watts,
-                MANUAL_MODE_VALUE,
-                setpoint,
-            )
-            # 1) Habilitar control manual / externo
-            self._write_u32(client, REGISTER_CONTROL_MODE, MANUAL_MODE_VALUE)
-            # 2) Escribir consigna de potencia (positiva = descarga)
-            self._write_s32(client, REGISTER_POWER_SETPOINT, setpoint)
-        except Exception as e:
-            _LOGGER.error("Error al forzar descarga en batería SMA: %s", e)
-        finally:
-            client.close()
+        _LOGGER.info(
+            "Configurando batería SMA en modo MANUAL descarga %s W "
+            "(40151=%s, 40149=%s)",
+            watts,
+            MANUAL_MODE_VALUE,
+            setpoint,
+        )
+        # Consigna de potencia (positiva = descarga) + control manual / externo
+        await self._async_send(
+            _encode_block(setpoint, MANUAL_MODE_VALUE), "forzar descarga"
+        )
@@ -81,6 +81,9 @@ class SpockSmaMasterSwitch(SwitchEntity, RestoreEntity):
         else:
             self.coordinator.polling_enabled = True
             
-        _LOGGER.debug(f"Estado restaurado del switch maestro: {'ON' if self.coordinator.polling_enabled else 'OFF'}")
+        _LOGGER.debug(
+            "Estado restaurado del switch maestro: %s",
+            "ON" if self.coordinator.polling_enabled else "OFF",
+        )
         
         self.async_write_ha_state()